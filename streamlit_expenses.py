@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
@@ -21,26 +22,57 @@ logging.basicConfig(
 st.set_page_config(page_title="Expense Tracker", layout="wide")
 
 # Notion API Configuration
+NOTION_PAGE_SIZE = 100  # Largest page size the Notion API accepts
+
 @st.cache_resource
 def get_notion_client():
     # Get Notion API key from environment variable or Streamlit secrets
     notion_token = st.secrets["NOTION_TOKEN"]
     return Client(auth=notion_token)
 
-@st.cache_data(ttl=300)
-def load_data_from_notion():
+# Notion property extractors, applied once per column
+def _plain_text(rich_text):
+    # Notion splits styled text into runs; join them all, not just the first
+    return "".join(run.get("plain_text", "") for run in rich_text or [])
+
+def _name(prop):
+    return _plain_text(prop.get("title"))
+
+def _amount(prop):
+    # np.fromiter does the float64 conversion
+    return prop.get("number") or 0.0
+
+def _category(prop):
+    # Handle different possible category field types in Notion
+    if "select" in prop:
+        return (prop["select"] or {}).get("name", "")
+    if "multi_select" in prop:
+        multi_select = prop["multi_select"]
+        return multi_select[0]["name"] if multi_select else ""
+    if "rich_text" in prop:
+        return _plain_text(prop["rich_text"])
+    return ""
+
+def _date(prop):
+    return (prop.get("date") or {}).get("start")
+
+def _comment(prop):
+    return _plain_text(prop.get("rich_text"))
+
+def fetch_notion_pages():
     try:
         notion = get_notion_client()
         database_id = st.secrets["NOTION_DATABASE_ID"]
         
-        # Query the database
+        # Query the database, asking for Notion's maximum page size to keep the
+        # number of serial round trips down
         results = []
-        query = notion.databases.query(database_id=database_id)
+        query = notion.databases.query(database_id=database_id, page_size=NOTION_PAGE_SIZE)
         
         logging.info(f"Retrieved {len(query['results'])} initial results from Notion")
         
-        # Debug: Log the first result structure
-        if query["results"]:
+        # Debug: Log the first result structure (skip formatting it unless enabled)
+        if query["results"] and logging.getLogger().isEnabledFor(logging.DEBUG):
             logging.debug(f"First result structure: {query['results'][0]['properties']}")
         
         results.extend(query["results"])
@@ -49,78 +81,134 @@ def load_data_from_notion():
         while query.get("has_more", False):
             query = notion.databases.query(
                 database_id=database_id,
-                start_cursor=query["next_cursor"]
+                start_cursor=query["next_cursor"],
+                page_size=NOTION_PAGE_SIZE
             )
             results.extend(query["results"])
             logging.info(f"Retrieved additional {len(query['results'])} results")
         
-        processed_data = []
-        for page in results:
-            try:
-                properties = page["properties"]
-                date_value = properties.get("Date", {}).get("date", {}).get("start")
-                
-                # Debug category extraction
-                category_prop = properties.get("Category", {})
-                logging.info(f"Category property: {category_prop}")
-                
-                # Handle different possible category field types in Notion
-                category_value = ""
-                if category_prop:
-                    if "select" in category_prop:
-                        category_value = category_prop["select"]["name"] if category_prop["select"] else ""
-                    elif "multi_select" in category_prop:
-                        multi_select = category_prop["multi_select"]
-                        category_value = multi_select[0]["name"] if multi_select else ""
-                    elif "rich_text" in category_prop:
-                        rich_text = category_prop["rich_text"]
-                        category_value = rich_text[0]["text"]["content"] if rich_text else ""
-                    logging.info(f"Extracted category: {category_value}")
-                
-                # Handle different date formats and make timezone-aware
-                if date_value:
-                    try:
-                        # Parse datetime and make it timezone-aware
-                        parsed_date = pd.to_datetime(date_value, format='mixed')
-                        if parsed_date.tzinfo is None:
-                            parsed_date = parsed_date.tz_localize('UTC')
-                        # Convert to local timezone (IST)
-                        parsed_date = parsed_date.tz_convert('Asia/Kolkata')
-                        # Make timezone-naive for consistent comparison
-                        parsed_date = parsed_date.tz_localize(None)
-                    except Exception as e:
-                        logging.warning(f"Date parsing error: {e} for date {date_value}")
-                        # If parsing fails, try date-only format
-                        parsed_date = pd.to_datetime(date_value.split('T')[0])
-                else:
-                    parsed_date = None
-                
-                row = {
-                    "Name": properties.get("Name", {}).get("title", [{}])[0].get("text", {}).get("content", "") if properties.get("Name", {}).get("title") else "",
-                    "Amount": float(properties.get("Amount", {}).get("number", 0) or 0),
-                    "Category": category_value,  # Use the extracted category
-                    "Date": parsed_date,
-                    "Comment": properties.get("Comment", {}).get("rich_text", [{}])[0].get("text", {}).get("content", "") if properties.get("Comment", {}).get("rich_text") else ""
-                }
-                processed_data.append(row)
-            except Exception as e:
-                logging.error(f"Error processing row: {e}")
-                logging.error(f"Problematic row data: {properties}")
+        return results
         
-        if not processed_data:
+    except Exception as e:
+        logging.error(f"Error in fetch_notion_pages: {str(e)}")
+        raise
+
+def parse_notion_pages(pages):
+    try:
+        # Extract each column in one pass over the page properties; dates stay
+        # raw strings and are parsed together below
+        properties = [page["properties"] for page in pages]
+        names = [_name(p.get("Name", {})) for p in properties]
+        amounts = np.fromiter((_amount(p.get("Amount", {})) for p in properties),
+                              dtype=np.float64, count=len(properties))
+        categories = [_category(p.get("Category", {})) for p in properties]
+        date_strs = [_date(p.get("Date", {})) for p in properties]
+        comments = [_comment(p.get("Comment", {})) for p in properties]
+        
+        logging.info(f"Processed {len(names)} rows")
+        
+        if not names:
             logging.error("No data could be processed from the Notion database")
             return pd.DataFrame(columns=['Name', 'Amount', 'Category', 'Date', 'Comment'])
         
-        df = pd.DataFrame(processed_data)
+        df = pd.DataFrame({
+            "Name": names,
+            "Amount": amounts,
+            "Category": categories,
+            "Date": date_strs,
+            "Comment": comments
+        }).astype({'Category': 'category', 'Name': 'string[pyarrow]', 'Comment': 'string[pyarrow]'})
+        
+        # Parse all dates in one vectorized pass: naive values are treated as UTC,
+        # converted to local timezone (IST) and made timezone-naive for consistent
+        # comparison. Unparseable dates become NaT and are dropped.
+        df['Date'] = (
+            pd.to_datetime(df['Date'], utc=True, format='mixed', errors='coerce')
+            .dt.tz_convert('Asia/Kolkata')
+            .dt.tz_localize(None)
+        )
+        n_dropped = int(df['Date'].isna().sum())
+        if n_dropped:
+            logging.warning(f"Dropped {n_dropped} rows with missing/unparseable dates")
         df = df.dropna(subset=['Date'])
+        df['Category'] = df['Category'].cat.remove_unused_categories()
+        
+        # Derived date keys used for filtering and the monthly pivot
+        df['_DateOnly'] = df['Date'].dt.normalize()
+        df['Month'] = df['Date'].dt.to_period('M').astype(str).astype('category')
         
         logging.info(f"Successfully processed {len(df)} rows of data")
-        return df.sort_values('Date')
+        return df.sort_values('Date').reset_index(drop=True)
         
     except Exception as e:
-        logging.error(f"Error in load_data_from_notion: {str(e)}")
+        logging.error(f"Error in parse_notion_pages: {str(e)}")
         raise
 
+@st.cache_data(ttl=300, max_entries=1)
+def load_data_from_notion():
+    # Only the parsed DataFrame goes through the cache; the raw Notion pages are
+    # fetched and parsed again on each 5 minute refresh
+    return parse_notion_pages(fetch_notion_pages())
+
+def category_mask(categories, selected):
+    # Boolean lookup indexed by category code, so no per-row hashing like isin
+    cats = categories.cat.categories
+    keep = np.zeros(len(cats), dtype=bool)
+    positions = cats.get_indexer(selected)
+    keep[positions[positions >= 0]] = True
+    return keep[categories.cat.codes.to_numpy()]
+
+@st.cache_data(max_entries=2)
+def to_csv_bytes(df_hash, _df):
+    # Only re-encoded when the filtered rows change (df_hash), not on every rerun
+    return _df.drop(columns=['_DateOnly', 'Month']).to_csv(index=False).encode('utf-8')
+
+# Chart builders. The plotly express figures are cached on their (small,
+# aggregated) input frames; the go.Scattergl figures are cheaper to build than
+# to unpickle from the cache, so they are rebuilt on each rerun
+def build_daily_line(daily_expenses):
+    # WebGL trace keeps long daily series responsive in the browser
+    fig = go.Figure(go.Scattergl(x=daily_expenses['Date'], y=daily_expenses['Amount'],
+                                 mode='lines', line_shape='linear'))
+    fig.update_layout(height=400, xaxis_title='Date', yaxis_title='Total Expense (₹)')
+    return fig
+
+@st.cache_data
+def build_category_pie(category_expenses):
+    fig = px.pie(category_expenses, values='Amount', names='Category',
+                 hole=0.4)
+    fig.update_layout(height=400)
+    return fig
+
+@st.cache_data
+def build_category_bar(category_summary):
+    fig = px.bar(category_summary.reset_index(), x='Category', y='Total',
+                 title="Category-wise Total Expenses",
+                 labels={'Total': 'Total Expense (₹)'})
+    fig.update_layout(height=400)
+    return fig
+
+def build_monthly_trend(monthly_category_data):
+    fig = go.Figure()
+    
+    for category in monthly_category_data.columns:
+        fig.add_trace(go.Scattergl(
+            x=monthly_category_data.index,
+            y=monthly_category_data[category],
+            name=category,
+            mode='lines+markers'
+        ))
+    
+    fig.update_layout(
+        title="Monthly Spending Trends by Category",
+        xaxis_title="Month",
+        yaxis_title="Total Expense (₹)",
+        height=500,
+        hovermode='x unified',
+        yaxis=dict(tickformat="₹,.0f")
+    )
+    return fig
+
 # Modify the data loading section
 try:
     data = load_data_from_notion()
@@ -152,13 +240,16 @@ date_range = st.sidebar.date_input(
 # Convert to datetime for filtering
 if len(date_range) == 2:
     start_date, end_date = date_range
-    mask = (data['Date'].dt.date >= start_date) & (data['Date'].dt.date <= end_date)
-    filtered_data = data.loc[mask]
+    # data is sorted by Date, so binary-search the bounds and slice
+    lo = data['Date'].searchsorted(pd.Timestamp(start_date))
+    hi = data['Date'].searchsorted(pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    filtered_data = data.iloc[lo:hi]
 else:
     filtered_data = data
 
 # Category filter
-all_categories = sorted(data['Category'].unique())
+# Category is categorical, so this reads the (small) category list, not every row
+all_categories = data['Category'].cat.categories.sort_values().tolist()
 selected_categories = st.sidebar.multiselect(
     "Select Categories",
     all_categories,
@@ -166,7 +257,12 @@ selected_categories = st.sidebar.multiselect(
 )
 
 # Apply category filter
-filtered_data = filtered_data[filtered_data['Category'].isin(selected_categories)]
+filtered_data = filtered_data[category_mask(filtered_data['Category'], selected_categories)]
+# Group by category once and share it across the charts and summary table
+gb_cat = filtered_data.groupby('Category', sort=False, observed=True)['Amount']
+category_sum = gb_cat.sum()
+category_mean = gb_cat.mean()
+category_count = gb_cat.count()
 
 # Main content
 st.title("💰 Expense Analytics Dashboard")
@@ -179,12 +275,15 @@ with col1:
     st.metric("Total Expenses", f"₹{total_expense:,.2f}")
 
 with col2:
-    avg_daily_expense = total_expense / len(filtered_data['Date'].dt.date.unique())
+    avg_daily_expense = total_expense / filtered_data['_DateOnly'].nunique()
     st.metric("Average Daily Expense", f"₹{avg_daily_expense:,.2f}")
 
 with col3:
-    max_expense = filtered_data['Amount'].max()
-    max_expense_name = filtered_data.loc[filtered_data['Amount'].idxmax(), 'Name']
+    # Single argmax pass gives both the amount and its position
+    amounts = filtered_data['Amount'].to_numpy()
+    i = int(amounts.argmax())
+    max_expense = amounts[i]
+    max_expense_name = filtered_data['Name'].iat[i]
     st.metric("Highest Expense", f"₹{max_expense:,.2f}", max_expense_name)
 
 with col4:
@@ -196,58 +295,40 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("Daily Expenses Trend")
-    daily_expenses = filtered_data.groupby('Date')['Amount'].sum().reset_index()
-    fig = px.line(daily_expenses, x='Date', y='Amount',
-                  labels={'Amount': 'Total Expense (₹)', 'Date': 'Date'},
-                  line_shape='linear')
-    fig.update_layout(height=400)
-    st.plotly_chart(fig, use_container_width=True)
+    # filtered_data is already in Date order, so skip sorting the group keys
+    daily_expenses = filtered_data.groupby('Date', sort=False)['Amount'].sum().reset_index()
+    st.plotly_chart(build_daily_line(daily_expenses), use_container_width=True)
 
 with col2:
     st.subheader("Category-wise Distribution")
-    category_expenses = filtered_data.groupby('Category')['Amount'].sum().reset_index()
-    fig = px.pie(category_expenses, values='Amount', names='Category',
-                 hole=0.4)
-    fig.update_layout(height=400)
-    st.plotly_chart(fig, use_container_width=True)
+    category_expenses = category_sum.reset_index()
+    st.plotly_chart(build_category_pie(category_expenses), use_container_width=True)
 
 # Category-wise analysis
 st.subheader("Category-wise Analysis")
 col1, col2 = st.columns(2)
 
 with col1:
-    category_summary = filtered_data.groupby('Category').agg({
-        'Amount': ['sum', 'mean', 'count']
+    category_summary = pd.DataFrame({
+        'Total': category_sum,
+        'Average': category_mean,
+        'Count': category_count
     }).round(2)
-    category_summary.columns = ['Total', 'Average', 'Count']
     category_summary = category_summary.sort_values('Total', ascending=False)
     
-    # Format the currency columns
-    category_summary['Total'] = category_summary['Total'].apply(lambda x: f"₹{x:,.2f}")
-    category_summary['Average'] = category_summary['Average'].apply(lambda x: f"₹{x:,.2f}")
-    
-    st.dataframe(category_summary, use_container_width=True)
+    # Format the currency columns at render time, keeping the values numeric
+    st.dataframe(
+        category_summary.style.format({'Total': '₹{:,.2f}', 'Average': '₹{:,.2f}'}),
+        use_container_width=True
+    )
 
 with col2:
     # Bar chart for category-wise expenses
-    fig = px.bar(category_summary.reset_index(), x='Category', y='Total',
-                 title="Category-wise Total Expenses",
-                 labels={'Total': 'Total Expense (₹)'})
-    fig.update_layout(height=400)
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(build_category_bar(category_summary), use_container_width=True)
 
 # Monthly Category Trends
 st.subheader("Monthly Category Trends")
 
-# Prepare monthly category data
-filtered_data['Month'] = filtered_data['Date'].dt.strftime('%Y-%m')
-monthly_category_data = filtered_data.pivot_table(
-    index='Month',
-    columns='Category',
-    values='Amount',
-    aggfunc='sum'
-).fillna(0)
-
 # Category selector for the trend
 selected_categories_trend = st.multiselect(
     "Select Categories to Compare",
@@ -258,49 +339,44 @@ selected_categories_trend = st.multiselect(
 
 # Create the trend line chart
 if selected_categories_trend:
-    fig = go.Figure()
-    
-    for category in selected_categories_trend:
-        fig.add_trace(go.Scatter(
-            x=monthly_category_data.index,
-            y=monthly_category_data[category],
-            name=category,
-            mode='lines+markers'
-        ))
-    
-    fig.update_layout(
-        title="Monthly Spending Trends by Category",
-        xaxis_title="Month",
-        yaxis_title="Total Expense (₹)",
-        height=500,
-        hovermode='x unified',
-        yaxis=dict(tickformat="₹,.0f")
+    # Prepare monthly data for the selected categories only, keeping every month
+    # in the filtered range (Month categories are sorted, i.e. chronological)
+    sub = filtered_data[category_mask(filtered_data['Category'], selected_categories_trend)]
+    monthly_category_data = (
+        sub.groupby(['Month', 'Category'], observed=True, sort=False)['Amount']
+        .sum()
+        .unstack('Category', fill_value=0)
+        .reindex(index=filtered_data['Month'].cat.remove_unused_categories().cat.categories,
+                 columns=selected_categories_trend, fill_value=0)
+        .rename_axis('Month')
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(build_monthly_trend(monthly_category_data), use_container_width=True)
     
     # Show the monthly data in a table
     st.subheader("Monthly Category-wise Expenses")
-    monthly_data_display = monthly_category_data[selected_categories_trend].copy()
     # Format all numbers as currency
-    for col in monthly_data_display.columns:
-        monthly_data_display[col] = monthly_data_display[col].apply(lambda x: f"₹{x:,.2f}")
-    st.dataframe(monthly_data_display, use_container_width=True)
+    st.dataframe(
+        monthly_category_data[selected_categories_trend].style.format('₹{:,.2f}'),
+        use_container_width=True
+    )
 
 # Recent transactions
 st.subheader("Recent Transactions")
-recent_transactions = filtered_data.sort_values('Date', ascending=False).head(10)
+# filtered_data is already in Date order, so the last 10 rows, reversed, are the newest
+recent_transactions = filtered_data.iloc[-10:][::-1]
 st.dataframe(
     recent_transactions[['Date', 'Name', 'Amount', 'Category']].style.format({
-        'Amount': lambda x: f"₹{x:,.2f}"
+        'Amount': '₹{:,.2f}'
     }),
     use_container_width=True
 )
 
 # Download filtered data
+filtered_hash = hash(pd.util.hash_pandas_object(filtered_data, index=False).values.tobytes())
 st.download_button(
     label="Download Filtered Data",
-    data=filtered_data.to_csv(index=False).encode('utf-8'),
+    data=to_csv_bytes(filtered_hash, filtered_data),
     file_name="filtered_expenses.csv",
     mime="text/csv"
 )
\ No newline at end of file